@@ -9,11 +9,19 @@ import logging
 import sys
 
 logger = logging.getLogger("lrl_toolbox")
+# Silent by default. Applications configure logging themselves or opt in with configure_logging
+logger.addHandler(logging.NullHandler())
 
 handler = logging.StreamHandler(sys.stdout)
-handler.setLevel(logging.DEBUG)
 
 formatter = logging.Formatter('[%(asctime)s] {%(filename)s:%(lineno)d} %(levelname)s - %(message)s')
 
 handler.setFormatter(formatter)
-logger.addHandler(handler)
+
+
+def configure_logging(level: int = logging.DEBUG) -> None:
+    """Print the package logs from `level` up to stdout."""
+    handler.setLevel(level)
+    logger.setLevel(level)
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
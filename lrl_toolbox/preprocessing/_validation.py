@@ -0,0 +1,24 @@
+import numpy as np
+from sklearn.utils import assert_all_finite
+from sklearn.utils.validation import check_array
+
+# float16 is left out on purpose, check_array upcasts it to float64
+SUPPORTED_FLOAT_DTYPES = (np.float64, np.float32)
+
+
+def check_float_array(X, copy: bool = False, accept_sparse: bool = True):
+    # Same result as check_array(X, accept_sparse=accept_sparse, dtype=SUPPORTED_FLOAT_DTYPES, copy=copy).
+    # Plain 2D float ndarrays are returned as they are (or copied) after the
+    # finiteness check, skipping check_array's conversion machinery
+    if (
+        type(X) is np.ndarray
+        and X.ndim == 2
+        and X.dtype in SUPPORTED_FLOAT_DTYPES
+        and X.flags.c_contiguous
+        and X.shape[0] > 0
+        and X.shape[1] > 0
+    ):
+        assert_all_finite(X)
+        return X.copy() if copy else X
+
+    return check_array(X, accept_sparse=accept_sparse, dtype=list(SUPPORTED_FLOAT_DTYPES), copy=copy)
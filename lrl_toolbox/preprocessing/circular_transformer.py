@@ -1,3 +1,4 @@
+import math
 from typing import Any, Dict, List, Optional
 
 import numpy as np
@@ -5,6 +6,30 @@ from pydantic.typing import Literal
 from sklearn.base import BaseEstimator, TransformerMixin
 from sklearn.utils.validation import check_array, check_is_fitted
 
+from lrl_toolbox.preprocessing._validation import SUPPORTED_FLOAT_DTYPES, check_float_array
+
+try:
+    from numba import njit, prange
+except ImportError:  # numba is an optional extra
+    njit = None  # type: ignore
+
+
+if njit is not None:
+
+    @njit(parallel=True, cache=True)
+    def _cos_sin_kernel(X, scale, out):  # pragma: no cover - compiled by numba
+        # Single pass over X: sin and cos of the same angle get fused by LLVM.
+        # No fastmath, it would let LLVM assume there are no NaNs
+        n, m = X.shape
+        for i in prange(n):
+            for j in range(m):
+                v = X[i, j] * scale[j]
+                out[i, j] = math.cos(v)
+                out[i, j + m] = math.sin(v)
+
+else:
+    _cos_sin_kernel = None
+
 
 class CricularTransformer(BaseEstimator, TransformerMixin):
     def __init__(
@@ -24,7 +49,7 @@ class CricularTransformer(BaseEstimator, TransformerMixin):
             self.feature_names_out_ = cos_names + sin_names
 
         # Check X,y shape
-        X = check_array(X, accept_sparse=True)
+        X = check_array(X, accept_sparse=True, dtype=list(SUPPORTED_FLOAT_DTYPES))
         self.n_features_in_ = X.shape[1]
         self.n_features_out_ = self.n_features_in_ * 2
 
@@ -38,22 +63,40 @@ class CricularTransformer(BaseEstimator, TransformerMixin):
                 )
             self.period_ = np.array(self.period)
 
+        # Angular frequency, so transform multiplies instead of dividing.
+        # Stored contiguous and in the fit dtype to avoid upcasting float32 inputs
+        self._scale_ = np.ascontiguousarray(2.0 * np.pi / self.period_, dtype=X.dtype)
+
         return self
 
     def transform(self, X) -> np.ndarray:
 
         check_is_fitted(self, "period_")
 
-        X = check_array(X, accept_sparse=True)
+        X = check_float_array(X)
         if X.shape[1] != self.n_features_in_:
             raise ValueError(
                 "Unexpected input shape. Got %d, expected %d (from fit)" % (X.shape[1], self.n_features_in_)
             )
 
-        X = X / self.period_ * (2 * np.pi)
-        X_cos = np.cos(X)
-        X_sin = np.sin(X)
-        return np.concatenate([X_cos, X_sin], axis=1)
+        # Write cos/sin straight into the two halves of the output
+        # instead of concatenating two temporaries
+        m = self.n_features_in_
+        scale = self._scale_.astype(X.dtype, copy=False)
+        # The kernel is only compiled for float32/float64, check_float_array upcasts anything else
+        if _cos_sin_kernel is not None and isinstance(X, np.ndarray) and X.dtype in SUPPORTED_FLOAT_DTYPES:
+            out = np.empty((X.shape[0], 2 * m), dtype=X.dtype)
+            _cos_sin_kernel(X, scale, out)
+            return out
+
+        # The angles are computed in the sin half, cos reads them from there
+        # and sin then overwrites them in place. No n x m temporaries
+        out = np.empty((X.shape[0], 2 * m), dtype=X.dtype)
+        angles = out[:, m:]
+        np.multiply(X, scale, out=angles)
+        np.cos(angles, out=out[:, :m])
+        np.sin(angles, out=angles)
+        return out
 
     def _more_tags(self) -> Dict[str, Any]:
         return {"allow_nan": True, "X_types": ["2darray", "2dlabels"]}
@@ -1,9 +1,33 @@
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, Tuple, Union
 
 import numpy as np
+from joblib import Memory
 from pydantic.typing import Literal
 from sklearn.base import BaseEstimator, TransformerMixin
-from sklearn.utils.validation import check_array, check_is_fitted
+from sklearn.utils.validation import FLOAT_DTYPES, check_array, check_is_fitted, check_memory
+
+from lrl_toolbox.preprocessing._validation import check_float_array
+
+
+def _column_quantiles(X: np.ndarray, quantile_range: Tuple[float, float]) -> np.ndarray:
+    # Module level so joblib.Memory can cache it across fits.
+    # Linear interpolated quantiles, same as np.nanquantile, selecting only
+    # the needed order statistics with an in-place partition over a
+    # column-major copy of X, so each column is partitioned contiguously
+    q = np.asarray(quantile_range, dtype=np.float64)
+    if np.any((q < 0) | (q > 1)):
+        raise ValueError("Quantiles must be in the range [0, 1]")
+
+    n = X.shape[0]
+    position = q * (n - 1)
+    lower = np.floor(position).astype(np.intp)
+    upper = np.minimum(lower + 1, n - 1)
+    fraction = position - lower
+
+    columns = np.array(X.T, order="C")
+    columns.partition(np.unique(np.concatenate([lower, upper])), axis=1)
+    # fit rejects NaNs, so no column needs the NaN-aware path
+    return (columns[:, lower] + fraction * (columns[:, upper] - columns[:, lower])).T
 
 
 class Winsorizer(BaseEstimator, TransformerMixin):
@@ -11,9 +35,13 @@ class Winsorizer(BaseEstimator, TransformerMixin):
         self,
         quantile_range: Tuple[float, float] = (0.1, 0.9),
         nan_policy: Literal["propagate", "raise", "omit"] = "propagate",  # type: ignore
+        copy: bool = True,
+        memory: Union[None, str, Memory] = None,
     ):
         self.quantile_range = quantile_range
         self.nan_policy = nan_policy
+        self.copy = copy
+        self.memory = memory
 
     def fit(self, X, y=None) -> "Winsorizer":
 
@@ -22,34 +50,36 @@ class Winsorizer(BaseEstimator, TransformerMixin):
             self.feature_names_out_ = self.feature_names_in_
 
         # Check X,y shape
-        X = check_array(X, accept_sparse=True)
+        X = check_array(X, accept_sparse=False, dtype=FLOAT_DTYPES)
         self.n_features_in_ = X.shape[1]
 
-        # Compute quantiles
-        self.quantiles_ = np.nanquantile(X, self.quantile_range, axis=0, interpolation="linear")
+        # Compute quantiles. With a memory, refitting on the same data
+        # (e.g. across a hyperparameter search) reuses the cached result
+        memory = check_memory(self.memory)
+        self.quantiles_ = memory.cache(_column_quantiles)(X, tuple(self.quantile_range))
+        # Keep each bound as its own contiguous array in the input dtype
+        # so clipping float32 data does not upcast to float64
+        self.quantiles_low_ = np.ascontiguousarray(self.quantiles_[0], dtype=X.dtype)
+        self.quantiles_high_ = np.ascontiguousarray(self.quantiles_[1], dtype=X.dtype)
         self.n_features_out_ = self.n_features_in_
 
         return self
 
-    @staticmethod
-    def _winsorize_1d(v: np.ndarray, low_value: np.number, up_value: np.number) -> np.ndarray:
-        v[v <= low_value] = low_value
-        v[v >= up_value] = up_value
-        return v
-
     def transform(self, X) -> np.ndarray:
 
         check_is_fitted(self, "quantiles_")
 
-        X = check_array(X, accept_sparse=True)
+        # With copy=False float arrays are clipped in place
+        X = check_float_array(X, copy=self.copy, accept_sparse=False)
         if X.shape[1] != self.n_features_in_:
             raise ValueError(
                 "Unexpected input shape. Got %d, expected %d (from fit)" % (X.shape[1], self.n_features_in_)
             )
 
-        for i in range(self.n_features_in_):
-            self._winsorize_1d(X[:, i], self.quantiles_[0, i], self.quantiles_[1, i])
-        return X
+        # Clip every column at once. The bounds broadcast along the rows
+        low = self.quantiles_low_.astype(X.dtype, copy=False)
+        high = self.quantiles_high_.astype(X.dtype, copy=False)
+        return np.clip(X, low, high, out=X)
 
     def _more_tags(self) -> Dict[str, Any]:
         return {"allow_nan": True, "X_types": ["2darray", "2dlabels"]}
@@ -1,19 +1,27 @@
+import concurrent.futures
+import copy
 import datetime
 import functools
 import json
 import math
+import mmap
 import os
 import pickle
-import sys
+import struct
+from collections import defaultdict
 from collections.abc import Sequence
 from pathlib import Path
-from typing import Any, ClassVar, Dict, List, Optional, Set, Tuple, Union
+from typing import Any, Callable, ClassVar, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
 import fasteners  # Cross platform locks
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 import tqdm
 import yaml  # type: ignore
-from pydantic import BaseModel, Field, validator
+from pandas._libs.parsers import STR_NA_VALUES
+from pyarrow import csv as pacsv
+from pydantic import BaseModel, Field, root_validator, validator
 from pydantic.typing import Literal
 
 from lrl_toolbox import logger
@@ -27,12 +35,15 @@ from lrl_toolbox.utils.filetree.exceptions import InvalidRootDirException, Inval
 ###
 class LocalFileTreeConfig(BaseModel):
 
-    file_count: int = Field(0, description="")
     tree_depth: int = Field(2, description="")
 
     leaf_depth: int = Field(7, description="")
 
-    file_format: Literal["feather", "csv", "json", "yaml", "pickle"] = Field(True, description="")
+    file_format: Literal["parquet", "feather", "csv", "json", "yaml", "pickle"] = Field("parquet", description="")
+    compression: Literal["uncompressed", "lz4", "zstd", "snappy"] = Field(
+        "zstd", description="Codec for parquet/feather files. Feather only supports lz4 and zstd"
+    )
+    compression_level: Optional[int] = Field(None, description="Codec level. None uses the codec's default")
 
     has_metadata: bool = Field(True, description="")
 
@@ -43,28 +54,169 @@ class LocalFileTreeConfig(BaseModel):
         validate_assignment = True
         allow_mutation = False
 
+    @root_validator(skip_on_failure=True)
+    def check_compression(cls, values: Dict[str, Any]) -> Dict[str, Any]:
+        if values["file_format"] == "feather" and values["compression"] == "snappy":
+            raise ValueError("Feather files do not support snappy compression")
+        if values["compression_level"] is not None and values["compression"] in {"snappy", "uncompressed"}:
+            raise ValueError("Cannot set compression_level with compression=%s" % values["compression"])
+        return values
+
+
+def _dedup_column_names(names: List[str]) -> List[str]:
+    # Same renaming as pd.read_csv: repeated names get a .1, .2, ... suffix
+    counts: Dict[str, int] = defaultdict(int)
+    deduped = []
+    for name in names:
+        count = counts[name]
+        while count > 0:
+            counts[name] = count + 1
+            name = "%s.%d" % (name, count)
+            count = counts[name]
+        deduped.append(name)
+        counts[name] = count + 1
+    return deduped
+
+
+def _read_csv(f: Any, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    # Arrow's multithreaded C++ parser. It needs a binary stream.
+    # Set up to give the same frames as pd.read_csv: pandas' NA tokens
+    # are missing values, and dates/timestamps are kept as text
+    convert_options = pacsv.ConvertOptions(strings_can_be_null=True, null_values=sorted(STR_NA_VALUES))
+    if columns is not None:
+        convert_options.include_columns = columns
+    table = pacsv.read_csv(f, convert_options=convert_options)
+
+    temporal = [field.name for field in table.schema if pa.types.is_temporal(field.type)]
+    if temporal:
+        # Arrow's type inference can't skip dates, parse those columns again as text
+        f.seek(0)
+        convert_options.column_types = {name: pa.string() for name in temporal}
+        table = pacsv.read_csv(f, convert_options=convert_options)
+
+    # Columns with only missing values are float NaN columns in pandas
+    for i, field in enumerate(table.schema):
+        if pa.types.is_null(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pa.float64()))
+    table = table.rename_columns(_dedup_column_names(table.column_names))
+
+    data = table.to_pandas()
+    # Missing values in object columns come back as None, pandas uses NaN
+    object_columns = data.columns[data.dtypes == object]
+    if len(object_columns) > 0:
+        data[object_columns] = data[object_columns].where(data[object_columns].notna(), np.nan)
+    return data
+
+
+def _write_feather(
+    data: pd.DataFrame, f: Any, compression: str = "zstd", compression_level: Optional[int] = None
+) -> None:
+    data.to_feather(f, compression=compression, compression_level=compression_level)
+
+
+def _write_parquet(
+    data: pd.DataFrame, f: Any, compression: str = "zstd", compression_level: Optional[int] = None
+) -> None:
+    codec = "none" if compression == "uncompressed" else compression
+    data.to_parquet(f, compression=codec, compression_level=compression_level, index=False)
+
+
+# Pickle files with out-of-band buffers start with this magic, followed by the
+# buffer count, the pickle stream size and the size of each buffer
+_PICKLE_OOB_MAGIC = b"LRLPKL5\x00"
+# Every buffer starts at a multiple of this in the file and in memory,
+# so the unpickled arrays are aligned
+_PICKLE_ALIGNMENT = 64
+
+
+def _pickle_padding(offset: int) -> int:
+    return -offset % _PICKLE_ALIGNMENT
+
+
+def _write_pickle(data: Any, f: Any) -> None:
+    # Protocol 5 hands large contiguous buffers (numpy arrays, pandas blocks)
+    # to buffer_callback, so they are written as is instead of being copied
+    # into the pickle stream
+    buffers: List[pickle.PickleBuffer] = []
+    stream = pickle.dumps(data, protocol=5, buffer_callback=buffers.append)
+    raws = [b.raw() for b in buffers]
+
+    header = _PICKLE_OOB_MAGIC
+    header += struct.pack("<QQ", len(raws), len(stream))
+    header += struct.pack("<%dQ" % len(raws), *[r.nbytes for r in raws])
+    f.write(header)
+    f.write(stream)
+    offset = len(header) + len(stream)
+    for raw in raws:
+        padding = _pickle_padding(offset)
+        f.write(b"\x00" * padding)
+        f.write(raw)
+        offset += padding + raw.nbytes
+
+
+def _read_pickle(f: Any) -> Any:
+    if f.read(len(_PICKLE_OOB_MAGIC)) != _PICKLE_OOB_MAGIC:
+        # Plain pickle file
+        f.seek(0)
+        return pickle.load(f)
+
+    n_buffers, stream_size = struct.unpack("<QQ", f.read(16))
+    sizes = struct.unpack("<%dQ" % n_buffers, f.read(8 * n_buffers))
+    stream = f.read(stream_size)
+    if n_buffers == 0:
+        return pickle.loads(stream)
+
+    # Buffer offsets relative to the first buffer, which is itself aligned
+    offset = len(_PICKLE_OOB_MAGIC) + 16 + 8 * n_buffers + stream_size
+    f.read(_pickle_padding(offset))
+    offsets = [0]
+    for size in sizes[:-1]:
+        end = offsets[-1] + size
+        offsets.append(end + _pickle_padding(end))
+
+    # Read all the buffers into a single writable, aligned block,
+    # the unpickled arrays are views over it
+    block_size = offsets[-1] + sizes[-1]
+    raw_block = np.empty(block_size + _PICKLE_ALIGNMENT, dtype=np.uint8)
+    start = _pickle_padding(raw_block.ctypes.data)
+    block = raw_block[start : start + block_size]
+    if f.readinto(block) != block_size:
+        raise pickle.UnpicklingError("Truncated pickle file")
+    view = block.data
+    buffers = [view[offset : offset + size] for offset, size in zip(offsets, sizes)]
+    return pickle.loads(stream, buffers=buffers)
+
 
 class TreeDataEntry(BaseModel):
     class Config:
         arbitrary_types_allowed = True
         allow_mutation = False
 
-    BINARY_FORMATS: ClassVar[Set[str]] = {"feather", "pickle"}
+    BINARY_FORMATS: ClassVar[Set[str]] = {"parquet", "feather", "pickle"}
+    # Formats whose parsers expect a binary stream, even if written as text
+    BINARY_PARSED_FORMATS: ClassVar[Set[str]] = BINARY_FORMATS | {"csv"}
+    # Formats whose parsers can read a subset of the columns. Parquet only
+    # decodes the requested columns, feather decodes the whole file anyway
+    COLUMN_FORMATS: ClassVar[Set[str]] = {"parquet", "feather", "csv"}
+    # Formats whose writers take the compression/compression_level kwargs
+    COMPRESSED_FORMATS: ClassVar[Set[str]] = {"parquet", "feather"}
 
     DATA_FILE_PARSERS: ClassVar[Dict[str, Any]] = {
-        "csv": pd.read_csv,
+        "csv": _read_csv,
+        "parquet": pd.read_parquet,
         "feather": pd.read_feather,
         "json": json.load,
         "yaml": yaml.load,
-        "pickle": pickle.load,
+        "pickle": _read_pickle,
     }
 
     DATA_FILE_WRITERS: ClassVar[Dict[str, Any]] = {
         "csv": functools.partial(pd.DataFrame.to_csv, index=False),
-        "feather": pd.DataFrame.to_feather,
+        "parquet": _write_parquet,
+        "feather": _write_feather,
         "json": json.dump,
         "yaml": yaml.dump,
-        "pickle": functools.partial(pickle.dump, protocol=pickle.HIGHEST_PROTOCOL),
+        "pickle": _write_pickle,
     }
 
     data: Union[pd.DataFrame, Dict[Any, Any], Any]
@@ -73,17 +225,7 @@ class TreeDataEntry(BaseModel):
     @validator("data", pre=True)
     def load_data(cls, value: Any):
         if isinstance(value, str) or isinstance(value, Path):
-            path = str(value)
-            # Get file extension
-            filename, file_extension = os.path.splitext(path)
-            # Remove the starting dot from the file extension
-            file_extension = file_extension.replace(".", "")
-            parser = cls.DATA_FILE_PARSERS[file_extension]
-            is_binary = file_extension in cls.BINARY_FORMATS
-            mode = "rb" if is_binary else "r"
-            encoding = None if is_binary else "utf-8"
-            with open(value, mode, encoding=encoding) as f:
-                return parser(f)
+            return _read_file(str(value))
         else:
             return value
 
@@ -94,45 +236,78 @@ class TreeDataEntry(BaseModel):
         elif isinstance(value, dict):
             return value
         else:
-            with open(value, "r", encoding="utf-8") as f:
-                value = json.load(f)
-            return value
+            return _read_metadata(value)
 
-    def write_data(self, path: Union[str, Path], format: str):
+    def write_data(self, path: Union[str, Path], format: str, **writer_kwargs):
         writer = self.DATA_FILE_WRITERS[format]
         filename, _ = os.path.splitext(str(path))  # Get rid of the extension (if any)
         is_binary = format in self.BINARY_FORMATS
         mode = "wb" if is_binary else "w"
         encoding = None if is_binary else "utf-8"
         with open(filename + "." + format, mode, encoding=encoding) as f:
-            writer(self.data, f)
+            writer(self.data, f, **writer_kwargs)
 
     def write_metadata(self, path: Union[str, Path]):
         filename, _ = os.path.splitext(str(path))  # Get rid of the extension (if any)
         with open(filename + "." + "metadata", "w", encoding="utf8") as f:
             json.dump(self.metadata, f)
 
-    def write(self, basename: Union[str, Path], format: str):
-        self.write_data(basename, format)
+    def write(self, basename: Union[str, Path], format: str, **writer_kwargs):
+        self.write_data(basename, format, **writer_kwargs)
         if self.metadata is not None:
             self.write_metadata(basename)
 
 
+def _read_file(path: str, columns: Optional[Iterable[str]] = None) -> Any:
+    # Get file extension
+    filename, file_extension = os.path.splitext(path)
+    # Remove the starting dot from the file extension
+    file_extension = file_extension.replace(".", "")
+    parser = TreeDataEntry.DATA_FILE_PARSERS[file_extension]
+    is_binary = file_extension in TreeDataEntry.BINARY_PARSED_FORMATS
+    mode = "rb" if is_binary else "r"
+    encoding = None if is_binary else "utf-8"
+    with open(path, mode, encoding=encoding) as f:
+        if columns is None:
+            return parser(f)
+        return parser(f, columns=list(columns))
+
+
+def _read_file_version(path: str, mtime_ns: int, columns: Optional[Tuple[str, ...]] = None) -> Any:
+    # mtime_ns is only part of the cache key, a rewritten file is parsed again
+    return _read_file(path, columns)
+
+
+def _read_metadata(path: Optional[Union[str, Path]]) -> Optional[Dict[str, Any]]:
+    if path is None:
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
 ####
 # Main class
 ####
 class LocalFileTree(Sequence):
 
     CONFIG_FILE: ClassVar[str] = ".filetree.json"
+    COUNTER_FILE: ClassVar[str] = ".counter"
     LOCKFILE: ClassVar[str] = ".LOCK"
     DATA_DIR: ClassVar[str] = "data"
+    # Entries fetched per lock acquisition when iterating the tree
+    ITER_CHUNK_SIZE: ClassVar[int] = 128
 
-    def __init__(self, root: str = "./", readonly: bool = False, **kwargs) -> None:
+    def __init__(self, root: str = "./", readonly: bool = False, cache_size: int = 0, **kwargs) -> None:
 
         self._root = root
         self._readonly = readonly
+        # Number of parsed data files kept in memory, 0 disables caching
+        self._cache_size = cache_size
+        self._init_cache()
         self._lock = fasteners.InterProcessReaderWriterLock(self._lock_file, logger=logger)
         self._last_config_read = datetime.datetime.min
+        # (config mtime, count) of the last legacy count read, see _legacy_file_count
+        self._legacy_count: Optional[Tuple[int, int]] = None
 
         # Validate the root directory
         self._validate_root_dir()
@@ -141,11 +316,16 @@ class LocalFileTree(Sequence):
 
         with self._rw_lock_context():
             self._load_config(load_only_if_modified=False, **kwargs)
+            self._open_counter()
 
     @property
     def _config_file(self) -> str:
         return os.path.join(self._root, self.CONFIG_FILE)
 
+    @property
+    def _counter_file(self) -> str:
+        return os.path.join(self._root, self.COUNTER_FILE)
+
     @property
     def _lock_file(self) -> str:
         return os.path.join(self._root, self.LOCKFILE)
@@ -170,7 +350,7 @@ class LocalFileTree(Sequence):
 
         if not os.path.exists(self._config_file):
             logger.info("New FileTree - Initializating config file")
-            self._config = LocalFileTreeConfig(file_count=0, **kwargs)
+            self._config = LocalFileTreeConfig(**kwargs)
             self._write_config()
             return self._config
 
@@ -182,9 +362,9 @@ class LocalFileTree(Sequence):
                 logger.debug("Config file not been modified since the last read")
                 return self._config
             else:
-                logger.info("Config file modified (%s vs %s). Updating" % (last_read, last_modified))
+                logger.info("Config file modified (%s vs %s). Updating", last_read, last_modified)
 
-        logger.debug("Reading Config file from %s" % self._config_file)
+        logger.debug("Reading Config file from %s", self._config_file)
         self._config = LocalFileTreeConfig.parse_file(self._config_file)
         self._last_config_read = datetime.datetime.now()
 
@@ -194,29 +374,100 @@ class LocalFileTree(Sequence):
         if self._readonly:
             raise InvalidTreeOperationException("Cannot modify the config file - Readonly mode")
 
-        logger.info("Writing config file to %s" % self._config_file)
+        logger.info("Writing config file to %s", self._config_file)
         with open(self._config_file, "w") as f:
             f.write(self._config.json())
         self._last_config_read = datetime.datetime.fromtimestamp(os.path.getmtime(self._config_file))
 
+    def _open_counter(self) -> None:
+        # The file count is kept out of the config, as a little endian uint64
+        # memory mapped from its own file. Reading it is a memory read and
+        # inserts bump it without rewriting the config
+        self._counter: Optional[mmap.mmap] = None
+
+        if not os.path.exists(self._counter_file):
+            if self._readonly:
+                # Legacy tree. Until a writer creates the counter file,
+                # len() reads the count from the config
+                return
+
+            # Trees created before the counter file kept the count in the config.
+            # Written to a temporary file first so readers never map a partial one
+            logger.info("Initializating file counter at %s", self._counter_file)
+            temporal_counter_file = self._counter_file + ".tmp"
+            with open(temporal_counter_file, "wb") as f:
+                f.write(struct.pack("<Q", self._legacy_file_count()))
+            os.replace(temporal_counter_file, self._counter_file)
+
+        mode, access = ("rb", mmap.ACCESS_READ) if self._readonly else ("r+b", mmap.ACCESS_WRITE)
+        with open(self._counter_file, mode) as f:
+            self._counter = mmap.mmap(f.fileno(), 8, access=access)
+
+    def _legacy_file_count(self) -> int:
+        # The config is only parsed again when it changes
+        mtime_ns = os.stat(self._config_file).st_mtime_ns
+        if self._legacy_count is None or self._legacy_count[0] != mtime_ns:
+            with open(self._config_file, "r", encoding="utf-8") as f:
+                self._legacy_count = (mtime_ns, json.load(f).get("file_count", 0))
+        return self._legacy_count[1]
+
+    def _bump_file_count(self, delta: int) -> None:
+        # Callers must hold the write lock
+        if self._counter is None:
+            raise InvalidTreeOperationException("Cannot modify the file count - Readonly mode")
+        struct.pack_into("<Q", self._counter, 0, len(self) + delta)
+        self._counter.flush()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Memory maps can't be pickled, the counter is mapped again on unpickling.
+        # The cache starts empty in the new process
+        state = self.__dict__.copy()
+        del state["_counter"]
+        del state["_cached_read"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._init_cache()
+        with self._rw_lock_context():
+            self._open_counter()
+
+    def _init_cache(self) -> None:
+        self._cached_read: Optional[Callable[..., Any]] = None
+        if self._cache_size > 0:
+            self._cached_read = functools.lru_cache(maxsize=self._cache_size)(_read_file_version)
+
+    def clear_cache(self) -> None:
+        if self._cached_read is not None:
+            self._cached_read.cache_clear()  # type: ignore[attr-defined]
+
+    def _read_entry(self, data_file: str, metadata_file: Optional[str], columns: Optional[List[str]]) -> TreeDataEntry:
+        if self._cached_read is None:
+            data = _read_file(data_file, columns)
+        else:
+            projection = tuple(columns) if columns is not None else None
+            # Hand out a copy so callers modifying their entry do not corrupt the cache
+            data = copy.deepcopy(self._cached_read(data_file, os.stat(data_file).st_mtime_ns, projection))
+        return TreeDataEntry(data=data, metadata=_read_metadata(metadata_file))
+
+    def _writer_kwargs(self) -> Dict[str, Any]:
+        if self._config.file_format not in TreeDataEntry.COMPRESSED_FORMATS:
+            return {}
+        return {"compression": self._config.compression, "compression_level": self._config.compression_level}
+
     def _decompose_index(self, value: int) -> List[int]:
 
         leaf_depth = self._config.leaf_depth
         depth = self._config.tree_depth
         bitmask = (1 << leaf_depth) - 1
 
-        indexes = []
-        for _ in range(depth):
-            indexes.append(value & bitmask)
-            value = value >> leaf_depth
-
-        # Reverse the indexes so the low-depth
-        # splits depend on leftmost bits.
+        # Splits go from the leftmost bits to the rightmost ones,
+        # so the low-depth splits depend on leftmost bits.
         # If we add new files and need to add a new depth to the
         # tree, the existing tree is just a branch of the new one
 
-        # Ignore the last split, its the position within the leaf.
-        return indexes[1:][::-1]
+        # Skip the last split (shift 0), its the position within the leaf.
+        return [(value >> (level * leaf_depth)) & bitmask for level in range(depth - 1, 0, -1)]
 
     def _index_files(self, idx: int) -> Tuple[str, Optional[str]]:
 
@@ -232,21 +483,76 @@ class LocalFileTree(Sequence):
             metadata_file = None
         return data_file, metadata_file
 
-    def get(self, idx: int) -> TreeDataEntry:
+    def _normalize_index(self, idx: int, file_count: int) -> int:
+        if idx < 0:
+            idx = file_count + idx
+
+        if idx < 0 or idx >= file_count:
+            raise IndexError("Out of bounds")
+        return idx
+
+    def _decompose_indices(self, idxs: np.ndarray) -> np.ndarray:
+        # Vectorized _decompose_index: one row per tree level (root first),
+        # one column per index
+        leaf_depth = self._config.leaf_depth
+        depth = self._config.tree_depth
+        bitmask = (1 << leaf_depth) - 1
+
+        shifts = np.arange(depth - 1, 0, -1, dtype=np.int64) * leaf_depth
+        return (idxs[None, :] >> shifts[:, None]) & bitmask
+
+    def _index_files_many(self, idxs: Iterable[int]) -> List[Tuple[str, Optional[str]]]:
+
+        ids = np.fromiter(idxs, dtype=np.int64)
+        data_dir = os.path.join(self._root, self.DATA_DIR)
+
+        files = []
+        for idx, indexes in zip(ids.tolist(), self._decompose_indices(ids).T.tolist()):
+            base_name = os.path.join(data_dir, *[str(i) for i in indexes])
+            data_file = os.path.join(base_name, "%s.%s" % (str(idx), self._config.file_format))
+            if self._config.has_metadata:
+                metadata_file: Optional[str] = os.path.join(base_name, "%s.metadata" % str(idx))
+            else:
+                metadata_file = None
+            files.append((data_file, metadata_file))
+        return files
+
+    def _check_columns(self, columns: Optional[List[str]]) -> None:
+        if columns is not None and self._config.file_format not in TreeDataEntry.COLUMN_FORMATS:
+            raise InvalidTreeOperationException("Cannot select columns from %s files" % self._config.file_format)
+
+    def _get_locked(self, idx: int, columns: Optional[List[str]] = None) -> TreeDataEntry:
+        # Callers must hold a lock and have loaded the config
+        data, metadata = self._index_files(self._normalize_index(idx, len(self)))
+        return self._read_entry(data, metadata, columns)
+
+    def get(self, idx: int, columns: Optional[List[str]] = None) -> TreeDataEntry:
 
         with self._lock.read_lock():
 
             self._load_config(load_only_if_modified=True)
+            self._check_columns(columns)
+            entry = self._get_locked(idx, columns)
+        return entry
 
-            if idx < 0:
-                idx = self._config.file_count + idx
+    def get_many(
+        self, idxs: Iterable[int], max_workers: Optional[int] = None, columns: Optional[List[str]] = None
+    ) -> List[TreeDataEntry]:
 
-            if idx >= self._config.file_count:
-                raise IndexError("Out of bounds")
+        with self._lock.read_lock():
 
-            data, metadata = self._index_files(idx)
-            entry = TreeDataEntry(data=data, metadata=metadata)
-        return entry
+            # Config and bounds are checked once for the whole batch
+            self._load_config(load_only_if_modified=True)
+            self._check_columns(columns)
+            file_count = len(self)
+            files = self._index_files_many([self._normalize_index(idx, file_count) for idx in idxs])
+
+            # Files are read in parallel. Arrow/pandas readers release the GIL
+            # while decoding. Reading stays under the lock since growing the
+            # tree moves the files around
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                entries = list(executor.map(lambda f: self._read_entry(f[0], f[1], columns), files))
+        return entries
 
     def _grow_tree(self, new_file_count: int) -> None:
         # Do we need to increase the tree's depth?
@@ -254,21 +560,23 @@ class LocalFileTree(Sequence):
         required_depth = math.ceil(max_bits / self._config.leaf_depth) + 1
         current_depth = self._config.tree_depth
 
-        logger.debug("Current Depth: %d, Required Depth: %d" % (current_depth, required_depth))
+        logger.debug("Current Depth: %d, Required Depth: %d", current_depth, required_depth)
         if required_depth > self._config.tree_depth:
 
             extra_levels = required_depth - current_depth
             temporal_data_dir = os.path.join(self._root, ".GROWING." + self.DATA_DIR)
             logger.info(
-                "Growing tree from depth %d to depth %d to accomodate %d entries"
-                % (current_depth, required_depth, new_file_count)
+                "Growing tree from depth %d to depth %d to accomodate %d entries",
+                current_depth,
+                required_depth,
+                new_file_count,
             )
 
             # We need to create a new 0/0... branch and move
             # the existing tree there
 
             # Rename data to - data old and then create data/0/0/0..
-            if self._config.file_count > 0:
+            if len(self) > 0:
                 os.rename(os.path.join(self._root, self.DATA_DIR), temporal_data_dir)
 
                 new_root_location = os.path.join(self._root, self.DATA_DIR, *["0" for i in range(extra_levels - 1)])
@@ -281,7 +589,12 @@ class LocalFileTree(Sequence):
             self._config = LocalFileTreeConfig(tree_depth=required_depth, **self._config.dict(exclude={"tree_depth"}))
             self._write_config()
 
-    def insert(self, values: Union[Sequence[TreeDataEntry], TreeDataEntry], progressbar: bool = True) -> Sequence[int]:
+    def insert(
+        self,
+        values: Union[Sequence[TreeDataEntry], TreeDataEntry],
+        progressbar: bool = True,
+        max_workers: Optional[int] = None,
+    ) -> Sequence[int]:
 
         if self._readonly:
             raise InvalidTreeOperationException("Insert Failed - Readonly mode")
@@ -296,46 +609,59 @@ class LocalFileTree(Sequence):
             self._load_config(load_only_if_modified=True)
 
             n_new_entries = len(values)
-            prev_file_count = self._config.file_count
+            prev_file_count = len(self)
             new_file_count = prev_file_count + n_new_entries
 
             # Increase tree's depth if needed to acommodate new entires
             self._grow_tree(new_file_count)
 
-            # At this point we know that we have enough capacity
-            leaf_capacity = 2 ** self._config.leaf_depth
-            progress_output = sys.stderr if progressbar else open(os.devnull, 'w')
-            for idx, entry in tqdm.tqdm(
-                enumerate(values, start=prev_file_count), file=progress_output, total=new_file_count
-            ):
-
-                data, metadata = self._index_files(idx)
-
-                # We need to create the dir for the new leaf
-                # That happens whenever idx mod leaf_capacity is 0
-                if (idx % leaf_capacity) == 0:
-                    logger.info("Creating new leaf at  %s" % (os.path.dirname(data)))
-                    os.makedirs(os.path.dirname(data), exist_ok=True)
-
-                entry.write_data(data, self._config.file_format)
-                if self._config.has_metadata:
+            # At this point we know that we have enough capacity.
+            # Resolve every path up front and create each leaf once
+            files = self._index_files_many(range(prev_file_count, new_file_count))
+            for leaf_dir in dict.fromkeys(os.path.dirname(data) for data, _ in files):
+                if not os.path.isdir(leaf_dir):
+                    logger.info("Creating new leaf at  %s", leaf_dir)
+                    os.makedirs(leaf_dir, exist_ok=True)
+
+            file_format = self._config.file_format
+            writer_kwargs = self._writer_kwargs()
+
+            def write_entry(item: Tuple[TreeDataEntry, Tuple[str, Optional[str]]]) -> None:
+                entry, (data, metadata) = item
+                entry.write_data(data, file_format, **writer_kwargs)
+                if metadata is not None:
                     entry.write_metadata(metadata)
 
-            # Update config with the new file count
-            self._config = LocalFileTreeConfig(file_count=new_file_count, **self._config.dict(exclude={"file_count"}))
-            self._write_config()
+            # Writes are IO bound and the arrow/pandas writers release the GIL,
+            # so the entries are written from a thread pool
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                written = executor.map(write_entry, zip(values, files))
+                for _ in tqdm.tqdm(written, total=n_new_entries, disable=not progressbar, mininterval=0.5):
+                    pass
+
+            # Entries are only counted once they are written
+            self._bump_file_count(n_new_entries)
 
         # Return new file's indexes
         return range(prev_file_count, prev_file_count + n_new_entries)
 
     def __len__(self) -> int:
-        return self._config.file_count
+        if self._counter is None:
+            self._open_counter()
+            if self._counter is None:
+                return self._legacy_file_count()
+        return struct.unpack_from("<Q", self._counter)[0]
+
+    def __iter__(self) -> Iterator[TreeDataEntry]:
+        # Sequence.__iter__ would call get() per entry, taking the lock
+        # and checking the config every time. Go chunk by chunk instead
+        file_count = len(self)
+        for start in range(0, file_count, self.ITER_CHUNK_SIZE):
+            yield from self.get_many(range(start, min(start + self.ITER_CHUNK_SIZE, file_count)))
 
     def __getitem__(self, key: Union[int, slice]) -> Any:
         if isinstance(key, slice):
-            start, stop, step = key.indices(len(self))
-            for i in range(start, stop, step):
-                yield self.get(i)
+            return self.get_many(range(*key.indices(len(self))))
         elif isinstance(key, int):
             return self.get(key)
         elif isinstance(key, tuple):
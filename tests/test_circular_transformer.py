@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+"""Tests for `lrl_toolbox.preprocessing.CricularTransformer`."""
+
+import numpy as np
+import pytest
+
+from lrl_toolbox.preprocessing import CricularTransformer, circular_transformer
+
+
+def _baseline(X, period):
+    angles = np.asarray(X, dtype=np.float64) / period * (2 * np.pi)
+    return np.concatenate([np.cos(angles), np.sin(angles)], axis=1)
+
+
+@pytest.fixture(params=["numpy", "numba"])
+def kernel_path(request, monkeypatch):
+    if request.param == "numpy":
+        monkeypatch.setattr(circular_transformer, "_cos_sin_kernel", None)
+    elif circular_transformer._cos_sin_kernel is None:
+        pytest.skip("numba is not installed")
+    return request.param
+
+
+@pytest.mark.parametrize("dtype", [np.float16, np.float32, np.float64])
+def test_transform_matches_baseline(kernel_path, dtype):
+    X = np.random.RandomState(0).uniform(0, 24, size=(50, 3)).astype(dtype)
+    period = [24.0, 12.0, 7.0]
+
+    out = CricularTransformer(period=period).fit(X).transform(X)
+
+    # float16 is upcast to float64 like before, float32 stays float32
+    assert out.dtype == (np.float32 if dtype == np.float32 else np.float64)
+    np.testing.assert_allclose(out, _baseline(X, np.array(period)), atol=1e-5 if dtype == np.float32 else 1e-12)
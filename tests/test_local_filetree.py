@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""Tests for `lrl_toolbox.utils.filetree`."""
+
+import io
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lrl_toolbox.utils import LocalFileTree
+from lrl_toolbox.utils.filetree.local_filetree import TreeDataEntry, _read_csv, _read_pickle, _write_pickle
+
+
+def _entries(start, stop):
+    return [TreeDataEntry(data={"i": i}, metadata={"i": i}) for i in range(start, stop)]
+
+
+@pytest.fixture
+def legacy_tree(tmp_path):
+    """Tree laid out as before the counter file: the count lives in the config."""
+    root = str(tmp_path / "tree")
+    LocalFileTree(root, file_format="json").insert(_entries(0, 9), progressbar=False)
+
+    os.remove(os.path.join(root, LocalFileTree.COUNTER_FILE))
+    config_file = os.path.join(root, LocalFileTree.CONFIG_FILE)
+    with open(config_file) as f:
+        config = json.load(f)
+    config["file_count"] = 9
+    with open(config_file, "w") as f:
+        json.dump(config, f)
+    return root
+
+
+def test_legacy_config_migrates_to_counter_file(legacy_tree):
+    reader = LocalFileTree(legacy_tree, readonly=True)
+    assert len(reader) == 9
+    assert not os.path.exists(os.path.join(legacy_tree, LocalFileTree.COUNTER_FILE))
+
+    writer = LocalFileTree(legacy_tree)
+    assert os.path.exists(os.path.join(legacy_tree, LocalFileTree.COUNTER_FILE))
+    assert len(writer) == 9
+    writer.insert(_entries(9, 19), progressbar=False)
+
+    # The reader opened before the migration follows the writer's inserts
+    assert len(reader) == 19
+    assert reader[18].data == {"i": 18}
+    assert [e.metadata["i"] for e in reader] == list(range(19))
+
+
+def test_legacy_count_is_read_once_per_batch(legacy_tree, monkeypatch):
+    reader = LocalFileTree(legacy_tree, readonly=True)
+    json_load = json.load
+    config_reads = []
+
+    def counting_load(f, *args, **kwargs):
+        if f.name.endswith(LocalFileTree.CONFIG_FILE):
+            config_reads.append(f.name)
+        return json_load(f, *args, **kwargs)
+
+    monkeypatch.setattr(json, "load", counting_load)
+    assert len(reader.get_many(range(9))) == 9
+    assert [e.data["i"] for e in reader] == list(range(9))
+    assert len(config_reads) == 1  # Parsed once, then cached while the config is unchanged
+
+
+def test_tree_pickles(tmp_path):
+    tree = LocalFileTree(str(tmp_path / "tree"), file_format="json")
+    tree.insert(_entries(0, 3), progressbar=False)
+
+    clone = pickle.loads(pickle.dumps(tree))
+    tree.insert(_entries(3, 5), progressbar=False)
+    assert len(clone) == 5
+    assert clone[-1].data == {"i": 4}
+
+
+def test_cache_is_opt_in_and_clearable(tmp_path):
+    root = str(tmp_path / "tree")
+    LocalFileTree(root, file_format="json").insert(_entries(0, 3), progressbar=False)
+    assert LocalFileTree(root, readonly=True)._cached_read is None
+
+    tree = LocalFileTree(root, readonly=True, cache_size=2)
+    tree[0].data["i"] = -1  # Entries are copies, the cached parse is untouched
+    assert tree[0].data == {"i": 0}
+    assert tree._cached_read.cache_info().hits == 1
+
+    tree.clear_cache()
+    assert tree._cached_read.cache_info().currsize == 0
+    assert pickle.loads(pickle.dumps(tree))[1].data == {"i": 1}
+
+
+def _pickle_round_trip(data):
+    f = io.BytesIO()
+    _write_pickle(data, f)
+    f.seek(0)
+    return _read_pickle(f)
+
+
+def test_pickle_dataframe_round_trip():
+    data = pd.DataFrame(
+        {
+            "i8": np.arange(7, dtype=np.int8),
+            "f8": np.linspace(0, 1, 7),
+            "f4": np.arange(7, dtype=np.float32),
+            "s": list("abcdefg"),
+        }
+    )
+    loaded = _pickle_round_trip(data)
+    pd.testing.assert_frame_equal(loaded, data)
+    loaded.loc[0, "f8"] = -1.0  # Views over the read block are writable
+
+
+def test_pickle_buffers_are_aligned():
+    # The float64 buffer follows an odd sized int8 one
+    loaded = _pickle_round_trip({"i8": np.arange(3, dtype=np.int8), "f8": np.arange(5.0)})
+    np.testing.assert_array_equal(loaded["f8"], np.arange(5.0))
+    for array in loaded.values():
+        assert array.flags.aligned
+        assert array.ctypes.data % 64 == 0
+
+
+def test_pickle_without_buffers():
+    data = {"a": 1, "b": [1.5, "x"], "c": None}
+    assert _pickle_round_trip(data) == data
+
+
+def test_pickle_fortran_order_arrays():
+    data = np.asfortranarray(np.arange(12.0).reshape(3, 4))
+    loaded = _pickle_round_trip(data)
+    np.testing.assert_array_equal(loaded, data)
+    assert loaded.flags.f_contiguous
+
+
+def test_read_plain_pickle_file():
+    data = {"array": np.arange(4), "frame": pd.DataFrame({"a": [1, 2]})}
+    loaded = _read_pickle(io.BytesIO(pickle.dumps(data)))
+    np.testing.assert_array_equal(loaded["array"], data["array"])
+    pd.testing.assert_frame_equal(loaded["frame"], data["frame"])
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "a,b,c\n1,x,2.5\n2,,3.5\n",
+        "a,a,b,a\n1,2,3,4\n5,6,7,8\n",
+        "a,b\nNone,1\nx,2\n",
+        "a,b,c\n<NA>,n/a,1\n<NA>,NULL,2\n",
+        "a,b\n,1\n,2\n",
+        "when,day\n2021-01-01 10:00:00,2021-01-01\n2021-01-02 11:30:00,2021-01-02\n",
+        "a,b\nNA,nan\n-NaN,#N/A\ntext,3\n",
+    ],
+)
+def test_read_csv_matches_pandas(text):
+    expected = pd.read_csv(io.BytesIO(text.encode()))
+    pd.testing.assert_frame_equal(_read_csv(io.BytesIO(text.encode())), expected)
+
+
+def test_read_csv_columns_match_pandas():
+    text = b"a,b,c\n1,x,2021-01-01\n2,,2021-01-02\n"
+    expected = pd.read_csv(io.BytesIO(text), usecols=["a", "c"])
+    pd.testing.assert_frame_equal(_read_csv(io.BytesIO(text), columns=["a", "c"]), expected)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""Tests for `lrl_toolbox.preprocessing.Winsorizer`."""
+
+import numpy as np
+import pytest
+
+from lrl_toolbox.preprocessing import Winsorizer
+from lrl_toolbox.preprocessing.winsorizer import _column_quantiles
+
+
+@pytest.mark.parametrize("n", [1, 2, 3, 10, 1001])
+@pytest.mark.parametrize("quantile_range", [(0.1, 0.9), (0.0, 1.0), (0.9, 0.1), (0.25, 0.25)])
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_column_quantiles_match_nanquantile(n, quantile_range, dtype):
+    X = np.random.RandomState(n).normal(size=(n, 4)).astype(dtype)
+    expected = np.nanquantile(X, quantile_range, axis=0)
+    np.testing.assert_allclose(_column_quantiles(X, quantile_range), expected, rtol=1e-6)
+
+
+def test_column_quantiles_reject_out_of_range():
+    with pytest.raises(ValueError):
+        _column_quantiles(np.ones((3, 2)), (-0.1, 0.9))
+
+
+def test_fit_rejects_nan():
+    with pytest.raises(ValueError):
+        Winsorizer().fit(np.array([[1.0], [np.nan], [3.0]]))
+
+
+def _masking_loop(X, quantiles):
+    # Clipping as done before np.clip
+    X = X.copy()
+    for i in range(X.shape[1]):
+        v = X[:, i]
+        v[v <= quantiles[0, i]] = quantiles[0, i]
+        v[v >= quantiles[1, i]] = quantiles[1, i]
+    return X
+
+
+@pytest.fixture
+def X():
+    return np.random.RandomState(0).normal(size=(200, 3))
+
+
+def test_transform_copy_leaves_input_untouched(X):
+    original = X.copy()
+    out = Winsorizer().fit(X).transform(X)
+    np.testing.assert_array_equal(X, original)
+    assert not np.shares_memory(out, X)
+
+
+def test_transform_without_copy_clips_in_place(X):
+    winsorizer = Winsorizer(copy=False).fit(X)
+    expected = _masking_loop(X, winsorizer.quantiles_)
+    assert winsorizer.transform(X) is X
+    np.testing.assert_array_equal(X, expected)
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_transform_preserves_dtype(X, dtype):
+    X = X.astype(dtype)
+    assert Winsorizer().fit(X).transform(X).dtype == dtype
+
+
+@pytest.mark.parametrize("quantile_range", [(0.1, 0.9), (0.0, 1.0), (0.5, 0.5)])
+def test_clip_matches_masking_loop(X, quantile_range):
+    winsorizer = Winsorizer(quantile_range=quantile_range).fit(X)
+    np.testing.assert_array_equal(winsorizer.transform(X), _masking_loop(X, winsorizer.quantiles_))